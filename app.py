@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+from bisect import bisect_left, insort
 from collections import deque
+from itertools import islice
 # import graphviz  <-- REMOVED FOR STABILITY
 
 # =========================================
@@ -44,23 +47,25 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# "Next Up" card in the Arena, formatted with the active match's details
+MATCH_CARD_TPL = '<div class="match-card"><h3>MATCH {mid} • ROUND {rnd}</h3><h1><span class="highlight">{p1}</span> VS <span class="highlight">{p2}</span></h1></div>'
+
 # =========================================
 # 🧠 PART 1: CORE DATA STRUCTURES (FAITHFUL C PORT)
 # =========================================
 
 class Player:
-    def __init__(self, id, name):
+    # W/L and score totals live in st.session_state.stats, indexed by idx
+    __slots__ = ('id', 'name', 'idx')
+    def __init__(self, id, name, idx):
         self.id = id
         self.name = name
-        self.wins = 0
-        self.losses = 0
-        self.score_for = 0
-        self.score_against = 0
+        self.idx = idx
     
-    def get_pd(self): return self.score_for - self.score_against
     def __repr__(self): return f"{self.name}"
 
 class Match:
+    __slots__ = ('match_id', 'player1', 'player2', 'winner', 'round', 'is_from_losers', 'is_leaf', 'player1_score', 'player2_score', 'slate')
     def __init__(self, match_id, round_num=0):
         self.match_id = match_id
         self.player1 = None
@@ -71,43 +76,24 @@ class Match:
         self.is_leaf = False
         self.player1_score = 0
         self.player2_score = 0
+        self.slate = None # (player1, player2), bound once both are known
 
 class MatchNode:
+    __slots__ = ('match', 'left', 'right', 'parent')
     def __init__(self, match):
         self.match = match
         self.left = None
         self.right = None
-
-class QueueNode:
-    def __init__(self, match_ptr):
-        self.match_ptr = match_ptr
-        self.next = None
-
-class Queue:
-    def __init__(self):
-        self.front = None
-        self.rear = None
-    def is_empty(self): return self.front is None
-    def enqueue(self, match_ptr):
-        if not match_ptr: return
-        n = QueueNode(match_ptr)
-        if self.rear is None: self.front = self.rear = n
-        else:
-            self.rear.next = n
-            self.rear = n
-    def iter_nodes(self):
-        cur = self.front
-        while cur:
-            yield cur.match_ptr
-            cur = cur.next
+        self.parent = None
 
 class AVLNode:
+    __slots__ = ('key', 'match_ptr', 'left', 'right', 'bf')
     def __init__(self, key, match_ptr):
         self.key = key
         self.match_ptr = match_ptr
         self.left = None
         self.right = None
-        self.height = 1
+        self.bf = 0 # height(left) - height(right)
 
 # =========================================
 # 💾 PART 2: GLOBAL STATE MANAGEMENT
@@ -117,15 +103,34 @@ def init_state():
     defaults = {
         'mode': "None",
         'players': [],
-        'player_map': {},
+        'taken_names': set(),
+        'player_df': None, # Roster table, rebuilt only after a registration
+        'stats': {
+            'wins': np.zeros(0, dtype=np.int32),
+            'losses': np.zeros(0, dtype=np.int32),
+            'sf': np.zeros(0, dtype=np.int64),
+            'sa': np.zeros(0, dtype=np.int64),
+            'pd': np.zeros(0, dtype=np.int64) # sf - sa, kept in step on each result
+        },
+        'leaderboard': [], # sorted (-wins, -pd, idx) keys, see board_key
         'next_pid': 1000,
         'next_mid': 100,
-        'bracket_root': None,
+        # Knockout structures kept together so hot paths resolve the proxy once
+        'tourney': {
+            'bracket_root': None,
+            'avl_root': None,
+            'match_by_id': {},
+            'match_queue': deque(),
+            'playable_ids': set(),
+            'text_lines': [],
+            'text_rows': {},
+            'bracket_text': None # joined text_lines, cleared whenever a line is redrawn
+        },
         'winners_root': None,
-        'match_queue': Queue(),
-        'avl_root': None,
         'losers_fifo': deque(),
         'matches_played': 0,
+        'stats_sig': None,
+        'stats_df': None,
         'rr_edges': 0,
         'rr_completed': 0,
         'rr_advance': 0
@@ -141,138 +146,199 @@ init_state()
 # =========================================
 
 # --- AVL Utils ---
-def avl_h(n): return n.height if n else 0
-def avl_bal(n): return avl_h(n.left) - avl_h(n.right) if n else 0
-def avl_rot_r(y):
-    x = y.left; T2 = x.right; x.right = y; y.left = T2
-    y.height = 1 + max(avl_h(y.left), avl_h(y.right))
-    x.height = 1 + max(avl_h(x.left), avl_h(x.right))
-    return x
-def avl_rot_l(x):
-    y = x.right; T2 = y.left; y.left = x; x.right = T2
-    x.height = 1 + max(avl_h(x.left), avl_h(x.right))
-    y.height = 1 + max(avl_h(y.left), avl_h(y.right))
-    return y
-def avl_ins(node, key, mptr):
-    if not node: return AVLNode(key, mptr)
-    if key < node.key: node.left = avl_ins(node.left, key, mptr)
-    elif key > node.key: node.right = avl_ins(node.right, key, mptr)
-    else: return node
-    node.height = 1 + max(avl_h(node.left), avl_h(node.right))
-    b = avl_bal(node)
-    if b > 1 and key < node.left.key: return avl_rot_r(node)
-    if b < -1 and key > node.right.key: return avl_rot_l(node)
-    if b > 1 and key > node.left.key: node.left = avl_rot_l(node.left); return avl_rot_r(node)
-    if b < -1 and key < node.right.key: node.right = avl_rot_r(node.right); return avl_rot_l(node)
-    return node
-def avl_find(node, key):
-    if not node or node.key == key: return node
-    return avl_find(node.left, key) if key < node.key else avl_find(node.right, key)
+def build_avl_from_sorted(pairs):
+    # pairs: (key, mptr) sorted by key; the middle element roots each subtree
+    def build(lo, hi):
+        if lo > hi: return None, 0
+        mid = (lo + hi) // 2
+        node = AVLNode(*pairs[mid])
+        node.left, lh = build(lo, mid - 1)
+        node.right, rh = build(mid + 1, hi)
+        node.bf = lh - rh
+        return node, 1 + max(lh, rh)
+    return build(0, len(pairs) - 1)[0]
 
 # --- Creation & Registration ---
-def create_match_node(r=0):
-    mid = st.session_state.next_mid
-    st.session_state.next_mid += 1
+def create_match_node(ctx, r=0):
+    mid = ctx['next_mid']
+    ctx['next_mid'] += 1
     mnode = MatchNode(Match(mid, r))
-    st.session_state.avl_root = avl_ins(st.session_state.avl_root, mid, mnode)
+    ctx['nodes'].append((mid, mnode))
     return mnode
 
+def board_key(stats, i):
+    return (-int(stats['wins'][i]), -int(stats['pd'][i]), i)
+
 def register_player(name):
     if st.session_state.mode != "None": return False, "Tournament already started."
-    if name in st.session_state.player_map: return False, "Name already taken."
+    taken, players = st.session_state.taken_names, st.session_state.players
+    if name in taken: return False, "Name already taken."
     pid = st.session_state.next_pid
     st.session_state.next_pid += 1
-    p = Player(pid, name)
-    st.session_state.players.append(p)
-    st.session_state.player_map[name] = p
+    p = Player(pid, name, len(players))
+    players.append(p)
+    stats = st.session_state.stats
+    for k, arr in stats.items():
+        stats[k] = np.resize(arr, p.idx + 1)
+        stats[k][p.idx] = 0
+    insort(st.session_state.leaderboard, board_key(stats, p.idx))
+    taken.add(name)
+    st.session_state.player_df = None
     return True, f"Registered {name} (ID: {pid})"
 
 # --- Bracket Generation ---
-def create_bracket_rec(parts, s, e):
+def create_bracket_rec(ctx, parts, s, e):
     if s == e:
-        leaf = create_match_node(1)
+        leaf = create_match_node(ctx, 1)
         leaf.match.is_leaf = True
         leaf.match.player1 = parts[s]
         return leaf
     mid = (s + e) // 2
-    left = create_bracket_rec(parts, s, mid)
-    right = create_bracket_rec(parts, mid + 1, e)
-    parent = create_match_node()
+    left = create_bracket_rec(ctx, parts, s, mid)
+    right = create_bracket_rec(ctx, parts, mid + 1, e)
+    parent = create_match_node(ctx)
     parent.left, parent.right = left, right
+    left.parent = right.parent = parent
     if left.match.is_leaf and right.match.is_leaf:
         parent.match.player1 = left.match.player1
         parent.match.player2 = right.match.player1
+        parent.match.slate = (parent.match.player1, parent.match.player2)
         parent.match.round = 1
-        st.session_state.match_queue.enqueue(parent)
+        ctx['ready'].append(parent)
     return parent
 
 def fix_rounds(node, depth, max_d):
-    if not node: return
-    if not node.match.is_leaf: node.match.round = max_d - depth
-    fix_rounds(node.left, depth + 1, max_d)
-    fix_rounds(node.right, depth + 1, max_d)
-
-def get_depth(node): return 1 + max(get_depth(node.left), get_depth(node.right)) if node else 0
+    q = deque([(node, depth)])
+    while q:
+        node, depth = q.popleft()
+        if not node: continue
+        if not node.match.is_leaf: node.match.round = max_d - depth
+        q.append((node.left, depth + 1))
+        q.append((node.right, depth + 1))
 
 def generate_ko():
     n = len(st.session_state.players)
     if n < 2: return False, "Need 2+ players."
-    st.session_state.match_queue = Queue()
-    root = create_bracket_rec(st.session_state.players, 0, n-1)
-    fix_rounds(root, 0, get_depth(root) - (1 if get_depth(root)>1 else 0))
-    st.session_state.bracket_root = root
+    # Build against a local context and publish it to session state once at the end
+    ctx = {'next_mid': st.session_state.next_mid, 'ready': deque(), 'nodes': []}
+    root = create_bracket_rec(ctx, st.session_state.players, 0, n-1)
+    # Midpoint splitting over n leaves gives a tree of depth 1 + ceil(log2(n))
+    d = 1 + (n - 1).bit_length()
+    fix_rounds(root, 0, d - (1 if d > 1 else 0))
+    st.session_state.next_mid = ctx['next_mid']
+    text_lines, text_rows = build_bracket_lines(root)
+    st.session_state.tourney = {
+        'bracket_root': root,
+        # Match ids are handed out in increasing order, so the AVL can be built in one pass
+        'avl_root': build_avl_from_sorted(ctx['nodes']),
+        'match_by_id': dict(ctx['nodes']),
+        'match_queue': ctx['ready'],
+        'playable_ids': {node.match.match_id for node in ctx['ready']},
+        'text_lines': text_lines,
+        'text_rows': text_rows,
+        'bracket_text': None
+    }
     st.session_state.mode = "Knockout"
     return True, f"Knockout generated for {n} players."
 
 # --- Match Updates ---
-def update_match_generic(node, mid, winner, s1, s2):
-    if not node: return False, None
-    m = node.match
-    if m.match_id == mid:
-        if m.winner: return True, None # Already played
-        m.winner = winner
-        st.session_state.matches_played += 1
-        winner.wins += 1
-        loser = m.player2 if m.player1 == winner else m.player1
-        if loser: loser.losses += 1
-        # Simple score tracking
-        winner.score_for += s1; winner.score_against += s2
-        if loser: loser.score_for += s2; loser.score_against += s1
-        m.player1_score = s1 if m.player1 == winner else s2
-        m.player2_score = s2 if m.player1 == winner else s1
-        return True, loser
-    f, l = update_match_generic(node.left, mid, winner, s1, s2)
-    if f: return True, l
-    return update_match_generic(node.right, mid, winner, s1, s2)
-
-def check_schedule(node):
-    if not node or node.match.is_leaf: return
-    check_schedule(node.left); check_schedule(node.right)
-    if node.left and node.right and node.left.match.winner and node.right.match.winner:
+def update_match_generic(mid, winner, s1, s2):
+    t = st.session_state.tourney
+    mnode = t['match_by_id'].get(mid)
+    if not mnode: return False, None
+    m = mnode.match
+    if m.winner: return True, None # Already played
+    m.winner = winner
+    st.session_state.matches_played += 1
+    # playable_ids is the ready set; match_queue keeps its order and is trimmed lazily
+    ids, mq = t['playable_ids'], t['match_queue']
+    ids.discard(mid)
+    while mq and mq[0].match.match_id not in ids: mq.popleft()
+    stats, board = st.session_state.stats, st.session_state.leaderboard
+    loser = m.player2 if m.player1 == winner else m.player1
+    # Only these two rows move, so re-slot them instead of re-sorting the board
+    movers = (winner.idx, loser.idx) if loser else (winner.idx,)
+    for i in movers: del board[bisect_left(board, board_key(stats, i))]
+    stats['wins'][winner.idx] += 1
+    if loser: stats['losses'][loser.idx] += 1
+    # Simple score tracking
+    stats['sf'][winner.idx] += s1; stats['sa'][winner.idx] += s2; stats['pd'][winner.idx] += s1 - s2
+    if loser: stats['sf'][loser.idx] += s2; stats['sa'][loser.idx] += s1; stats['pd'][loser.idx] += s2 - s1
+    for i in movers: insort(board, board_key(stats, i))
+    m.player1_score = s1 if m.player1 == winner else s2
+    m.player2_score = s2 if m.player1 == winner else s1
+    redraw_bracket_line(t, m)
+    return True, loser
+
+def check_schedule(done):
+    # Only the parent of the match just finished can become ready
+    node = done.parent
+    if node and node.left.match.winner and node.right.match.winner:
         if not node.match.winner and not node.match.player1:
              node.match.player1 = node.left.match.winner
              node.match.player2 = node.right.match.winner
-             st.session_state.match_queue.enqueue(node)
+             node.match.slate = (node.match.player1, node.match.player2)
+             t = st.session_state.tourney
+             t['match_queue'].append(node)
+             t['playable_ids'].add(node.match.match_id)
+             redraw_bracket_line(t, node.match)
 
 # =========================================
 # 📊 PART 4: SIMPLE TEXT VISUALIZATION (FALLBACK)
 # =========================================
-def get_bracket_text(node, level=0, prefix="Root: "):
-    if not node: return ""
-    m = node.match
+def _text_tail(m):
     p1 = m.player1.name if m.player1 else "TBD"
     p2 = m.player2.name if m.player2 else "TBD"
     win = f" -> Winner: {m.winner.name}" if m.winner else ""
-    indent = "    " * level
-    text = f"{indent}{prefix}[M{m.match_id}] {p1} vs {p2}{win}\n"
-    text += get_bracket_text(node.left, level + 1, "L--- ")
-    text += get_bracket_text(node.right, level + 1, "R--- ")
-    return text
+    return f"{p1} vs {p2}{win}\n"
+
+def build_bracket_lines(root):
+    # Preorder text lines plus mid -> (line index, static head) so one line can be redrawn
+    lines, rows = [], {}
+    stack = [(root, 0, "Root: ")]
+    while stack:
+        node, level, prefix = stack.pop()
+        if not node: continue
+        m = node.match
+        head = f"{'    ' * level}{prefix}[M{m.match_id}] "
+        rows[m.match_id] = (len(lines), head)
+        lines.append(head + _text_tail(m))
+        stack.append((node.right, level + 1, "R--- "))
+        stack.append((node.left, level + 1, "L--- "))
+    return lines, rows
+
+def redraw_bracket_line(t, m):
+    pos, head = t['text_rows'][m.match_id]
+    t['text_lines'][pos] = head + _text_tail(m)
+    t['bracket_text'] = None
+
+def build_stats_df(players, stats, board):
+    order = np.fromiter((k[2] for k in board), dtype=np.intp, count=len(board))
+    names = np.array([p.name for p in players], dtype=object)
+    return pd.DataFrame({
+        "Rank": np.arange(1, len(order) + 1, dtype=np.int32), "Name": names[order],
+        "W": stats['wins'][order], "L": stats['losses'][order], "PD": stats['pd'][order]
+    })
 
 # =========================================
 # 🚀 PART 5: MODERN MAIN UI
 # =========================================
 
+# --- Form Callbacks (run before the rerun they trigger) ---
+def commit_result(mid):
+    ss = st.session_state
+    mnode = ss.tourney['match_by_id'][mid]
+    winner = mnode.match.slate[ss[f"winner_{mid}"]]
+    ok, _ = update_match_generic(mid, winner, ss[f"s1_{mid}"], ss[f"s2_{mid}"])
+    if ok:
+        check_schedule(mnode)
+        st.toast(f"Match {mid} complete!", icon="🔥")
+
+def start_bracket():
+    # Outcome is shown by the Setup tab in the rerun this click triggers
+    if st.session_state.ttype == "Knockout":
+        st.session_state.gen_result = generate_ko()
+
 # --- Sidebar Dashboard ---
 with st.sidebar:
     st.title("🎮 Command Center")
@@ -302,21 +368,26 @@ with tab_setup:
                 else: st.error(msg)
         
         st.subheader("Initialization")
-        ttype = st.selectbox("Tournament Format", ["Knockout", "Round-Robin (Coming Soon)", "Double-Elim (Coming Soon)"])
-        if st.button("🚀 GENERATE BRACKET", disabled=(st.session_state.mode != "None")):
-             if ttype == "Knockout":
-                 ok, msg = generate_ko()
-                 if ok: 
-                     st.balloons()
-                     st.success(msg)
-                     st.rerun()
-                 else: st.error(msg)
+        st.selectbox("Tournament Format", ["Knockout", "Round-Robin (Coming Soon)", "Double-Elim (Coming Soon)"], key="ttype")
+        st.button("🚀 GENERATE BRACKET", disabled=(st.session_state.mode != "None"), on_click=start_bracket)
+        gen = st.session_state.pop("gen_result", None)
+        if gen:
+             ok, msg = gen
+             if ok: 
+                 st.balloons()
+                 st.success(msg)
+             else: st.error(msg)
 
     with c2:
         st.subheader("Roster")
         if st.session_state.players:
-            player_df = pd.DataFrame([{"ID": p.id, "Name": p.name} for p in st.session_state.players])
-            st.dataframe(player_df, use_container_width=True, hide_index=True)
+            if st.session_state.player_df is None:
+                players = st.session_state.players
+                st.session_state.player_df = pd.DataFrame({
+                    "ID": np.fromiter((p.id for p in players), dtype=np.int64, count=len(players)),
+                    "Name": [p.name for p in players]
+                })
+            st.dataframe(st.session_state.player_df, use_container_width=True, hide_index=True)
         else:
             st.info("Awaiting registrations...")
 
@@ -324,18 +395,16 @@ with tab_setup:
 with tab_play:
     st.header("⚔️ Active Match Arena")
     
-    # 1. Identify Playable Matches
-    playable = []
-    for mnode in st.session_state.match_queue.iter_nodes():
-        m = mnode.match
-        if m.player1 and m.player2 and not m.winner:
-            playable.append(mnode)
+    # 1. Playable Matches: the queue head is always the next ready match
+    t = st.session_state.tourney
+    playable, playable_ids, root = t['match_queue'], t['playable_ids'], t['bracket_root']
             
-    if not playable:
+    if not playable_ids:
+        champ = root.match.winner if root else None
         if st.session_state.mode == "None":
             st.warning("Tournament not started.")
-        elif st.session_state.bracket_root and st.session_state.bracket_root.match.winner:
-             st.success(f"🎉 TOURNAMENT COMPLETE! Champion: {st.session_state.bracket_root.match.winner.name}")
+        elif champ:
+             st.success(f"🎉 TOURNAMENT COMPLETE! Champion: {champ.name}")
         else:
              st.info("Waiting for previous rounds to finish...")
     else:
@@ -343,40 +412,34 @@ with tab_play:
         active_node = playable[0] # Simplification: just show the next one in queue prominently
         m = active_node.match
         
-        st.markdown(f"""
-        <div class="match-card">
-            <h3>MATCH {m.match_id} • ROUND {m.round}</h3>
-            <h1><span class="highlight">{m.player1.name}</span> VS <span class="highlight">{m.player2.name}</span></h1>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(MATCH_CARD_TPL.format(mid=m.match_id, rnd=m.round, p1=m.player1.name, p2=m.player2.name), unsafe_allow_html=True)
 
         with st.form("match_result"):
             c1, c2, c3 = st.columns([2,1,1])
-            winner_name = c1.radio("Select Winner", [m.player1.name, m.player2.name], horizontal=True)
-            s1 = c2.number_input(f"{m.player1.name} Score", min_value=0)
-            s2 = c3.number_input(f"{m.player2.name} Score", min_value=0)
-            
-            if st.form_submit_button("CONFIRM MATCH RESULT"):
-                w_obj = st.session_state.player_map[winner_name]
-                # For Knockout, we only need to update the main bracket root
-                ok, _ = update_match_generic(st.session_state.bracket_root, m.match_id, w_obj, s1, s2)
-                if ok:
-                    check_schedule(st.session_state.bracket_root)
-                    st.toast(f"Match {m.match_id} complete!", icon="🔥")
-                    st.rerun()
+            c1.radio("Select Winner", (0, 1), format_func=lambda i: m.slate[i].name, horizontal=True, key=f"winner_{m.match_id}")
+            c2.number_input(f"{m.player1.name} Score", min_value=0, key=f"s1_{m.match_id}")
+            c3.number_input(f"{m.player2.name} Score", min_value=0, key=f"s2_{m.match_id}")
+            st.form_submit_button("CONFIRM MATCH RESULT", on_click=commit_result, args=(m.match_id,))
 
         # Queue for others
-        if len(playable) > 1:
-            with st.expander(f"View {len(playable)-1} Other Pending Matches"):
-                 for pending in playable[1:]:
-                     pm = pending.match
-                     st.write(f"**M{pm.match_id}**: {pm.player1.name} vs {pm.player2.name}")
+        if len(playable_ids) > 1:
+            with st.expander(f"View {len(playable_ids)-1} Other Pending Matches"):
+                 # One table payload instead of a st.write per match
+                 pending = [n.match for n in islice(playable, 1, None) if n.match.match_id in playable_ids]
+                 st.dataframe(pd.DataFrame({
+                     "Match": [f"M{pm.match_id}" for pm in pending],
+                     "P1": [pm.player1.name for pm in pending],
+                     "P2": [pm.player2.name for pm in pending]
+                 }), use_container_width=True, hide_index=True)
 
 # === TAB 3: BRACKET VISUALIZATION (TEXT FALLBACK) ===
 with tab_bracket:
     st.header("🕸️ Tournament Tree")
-    if st.session_state.bracket_root:
-        st.text(get_bracket_text(st.session_state.bracket_root))
+    t = st.session_state.tourney
+    root = t['bracket_root']
+    if root:
+        if t['bracket_text'] is None: t['bracket_text'] = "".join(t['text_lines'])
+        st.text(t['bracket_text'])
     else:
         st.info("Bracket not generated.")
 
@@ -384,11 +447,14 @@ with tab_bracket:
 with tab_stats:
     st.header("📈 Live Leaderboard")
     if st.session_state.players:
-        # Simple sort by wins then PD
-        sorted_p = sorted(st.session_state.players, key=lambda x: (x.wins, x.get_pd()), reverse=True)
-        stats_data = [{
-            "Rank": i+1, "Name": p.name, "W": p.wins, "L": p.losses, "PD": p.get_pd()
-        } for i, p in enumerate(sorted_p)]
-        st.dataframe(pd.DataFrame(stats_data), use_container_width=True, hide_index=True)
+        # Ranked by wins then PD; rebuilt only when a player joins or a result lands
+        ss = st.session_state
+        players = ss.players
+        sig = (len(players), ss.matches_played)
+        stats_df = ss.stats_df
+        if ss.stats_sig != sig:
+            stats_df = ss.stats_df = build_stats_df(players, ss.stats, ss.leaderboard)
+            ss.stats_sig = sig
+        st.dataframe(stats_df, use_container_width=True, hide_index=True)
     else:
         st.info("No data yet.")
\ No newline at end of file